@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Box colors (BGR): green for PPE item, red for 'No' ppe classes
+VALID_COLOR = (0, 255, 0)
+VIOLATION_COLOR = (0, 0, 255)
+
+# Label font, sizes at full resolution (scaled with the output resolution)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 1
+FONT_THICKNESS = 2
+LABEL_HEIGHT = 40
+BOX_THICKNESS = 3
+
+# Default JPEG quality of annotated images (OpenCV's default, full resolution snapshots are written as before)
+JPEG_QUALITY = 95
+
+
+@lru_cache(maxsize=4096)
+def label_sprite(class_name, percent, color, scale):
+    """
+    Pre-render label (filled background plus white text) for a class, confidence bucket and color. Cached, only the
+    first occurrence of a label pays for cv2.getTextSize/putText
+    :param class_name: Label name
+    :param percent: Confidence in whole percent (confidences are rounded to 2 decimals, so no precision is lost)
+    :param color: Label color
+    :param scale: Output resolution scale
+    :return: Sprite image (read-only)
+    """
+    text = class_name + " " + str(float(percent)) + "%"
+    font_scale = FONT_SCALE * scale
+    thickness = max(int(round(FONT_THICKNESS * scale)), 1)
+
+    # Finds space required by the text so that we can put a background with that amount of width.
+    (w, h), _ = cv2.getTextSize(text, FONT, font_scale, thickness)
+    height = max(int(round(LABEL_HEIGHT * scale)), h + 2)
+
+    sprite = np.empty((height, w, 3), dtype=np.uint8)
+    sprite[:] = color
+    cv2.putText(sprite, text, (0, height - max(int(round(5 * scale)), 1)), FONT, font_scale, (255, 255, 255),
+                thickness)
+
+    sprite.setflags(write=False)
+    return sprite
+
+
+def blit(img, sprite, x, y):
+    """
+    Copy sprite into image with its top left corner at (x, y), clipped to the image bounds
+    :param img: Destination image
+    :param sprite: Sprite image
+    :param x: Left edge
+    :param y: Top edge
+    """
+    img_h, img_w = img.shape[:2]
+    sprite_h, sprite_w = sprite.shape[:2]
+
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + sprite_w, img_w), min(y + sprite_h, img_h)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    img[y0:y1, x0:x1] = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+class Annotator:
+    """
+    Draw detection boxes and labels, optionally at a reduced output resolution, and encode JPEG images
+    """
+
+    def __init__(self, output_width=None, jpeg_quality=JPEG_QUALITY):
+        """
+        :param output_width: Width of annotated images (keeps aspect ratio, never upscales), None for full resolution
+        :param jpeg_quality: JPEG quality (0-100) of encoded images
+        """
+        self.output_width = output_width
+        self.jpeg_quality = jpeg_quality
+
+    def render(self, img, outputs):
+        """
+        Draw bounding boxes and labels for detections (image is modified in place unless it's resized)
+        :param img: Source Image
+        :param outputs: Detections ([x_center, y_center, width, height, class_name, prob] per box)
+        :return: Annotated image
+        """
+        scale = 1.0
+        if self.output_width and img.shape[1] > self.output_width:
+            scale = self.output_width / img.shape[1]
+            img = cv2.resize(img, (self.output_width, int(round(img.shape[0] * scale))),
+                             interpolation=cv2.INTER_AREA)
+
+        if not outputs:
+            return img
+
+        # Top left and bottom right corners of all boxes at once (scaled to output resolution)
+        xywh = np.array([output[:4] for output in outputs], dtype=float) * scale
+        top_left = (xywh[:, :2] - xywh[:, 2:] / 2).astype(np.int32)
+        bottom_right = (xywh[:, :2] + xywh[:, 2:] / 2).astype(np.int32)
+        violations = np.array(['No' in output[4] for output in outputs])
+
+        # Boxes: one polylines call per color
+        corners = np.stack((top_left, np.stack((bottom_right[:, 0], top_left[:, 1]), axis=1),
+                            bottom_right, np.stack((top_left[:, 0], bottom_right[:, 1]), axis=1)), axis=1)
+        thickness = max(int(round(BOX_THICKNESS * scale)), 1)
+        for color, mask in ((VIOLATION_COLOR, violations), (VALID_COLOR, ~violations)):
+            if mask.any():
+                cv2.polylines(img, list(corners[mask]), True, color, thickness)
+
+        # Labels: cached sprites copied above the top left corner of each box
+        for output, (x, y), violation in zip(outputs, top_left.tolist(), violations):
+            color = VIOLATION_COLOR if violation else VALID_COLOR
+            sprite = label_sprite(output[4], int(round(output[5] * 100)), color, round(scale, 3))
+            blit(img, sprite, x, y - sprite.shape[0])
+
+        return img
+
+    def encode(self, img, outputs):
+        """
+        Annotate image and encode as JPEG
+        :param img: Source Image
+        :param outputs: Detections
+        :return: JPEG bytes
+        """
+        ret, buffer = cv2.imencode('.jpg', self.render(img, outputs), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes()
+
+    def write(self, path, img, outputs):
+        """
+        Annotate image and save as JPEG
+        :param path: Destination file path
+        :param img: Source Image
+        :param outputs: Detections
+        """
+        cv2.imwrite(path, self.render(img, outputs), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import multiprocessing
+from collections import deque
+
+import cv2
+
+
+def init_worker():
+    """
+    Decode worker initializer, one OpenCV thread per process (parallelism comes from the pool)
+    """
+    cv2.setNumThreads(1)
+
+
+def decode_task(task):
+    """
+    Decode the sampled frames of a task (executed in worker processes)
+    :param task: Decode task from iter_tasks
+    :return: List of (source, frame_index, timestamp_seconds, frame) tuples
+    """
+    kind, data = task
+    frames = []
+
+    if kind == 'image':
+        for path, image_index in data:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append((path, image_index, None, frame))
+        return frames
+
+    path, fps, step, start, end = data
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    # Read the segment sequentially, only sampled frames are retrieved. With the FFmpeg backend grab() still decodes
+    # every frame (retrieve() only converts it), but seeking would decode from the previous keyframe for each sample
+    for frame_index in range(start, end):
+        if not cap.grab():
+            break
+        if (frame_index - start) % step == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                frames.append((path, frame_index, round(frame_index / fps, 3), frame))
+
+    cap.release()
+    return frames
+
+
+def parallel_decode(tasks, workers):
+    """
+    Decode tasks in a pool of worker processes, yielding frames in order. At most 2 tasks per worker are in flight to
+    bound memory when inference is slower than decoding
+    :param tasks: Generator of decode tasks
+    :param workers: Number of worker processes
+    :return: Generator of decoded frames
+    """
+    # Spawn (not fork) workers, the parent process holds the model and torch thread pools. Workers re-import the
+    # main module, so it must not import the model at module level
+    with multiprocessing.get_context('spawn').Pool(workers, initializer=init_worker) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(decode_task, (task,)))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().get()
+
+        while pending:
+            yield from pending.popleft().get()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import asyncio
+import threading
+import time
+
+import orjson
+import paho.mqtt.client as mqtt
+from rich.console import Console
+
+import ppe_config
+
+# Rich Console Instance
+console = Console()
+
+# Max MQTT messages held between the network loop and detection (oldest message dropped when full)
+INGEST_BUFFER_SIZE = 10000
+
+# Max messages parsed per batch
+INGEST_BATCH_SIZE = 500
+
+# Seconds between telemetry reports
+TELEMETRY_INTERVAL = 30
+
+# Seconds to wait before reconnecting to the MQTT broker
+RECONNECT_DELAY = 5
+
+# Seconds to wait before restarting a failed background task (consumer, telemetry)
+TASK_RESTART_DELAY = 1
+
+
+def person_count(payload_dict):
+    """
+    Get number of people from a MV Sense payload ({"counts": {"person": N}, ...})
+    :param payload_dict: Parsed MQTT message payload
+    :return: Number of people (0 if the payload has no counts)
+    :raises TypeError: counts or person count of the wrong type
+    """
+    counts = payload_dict.get('counts') if isinstance(payload_dict, dict) else None
+    if counts is None:
+        return 0
+    if not isinstance(counts, dict):
+        raise TypeError(f"Invalid counts: {counts!r}")
+
+    person = counts.get('person', 0)
+    if isinstance(person, bool) or not isinstance(person, (int, float)):
+        raise TypeError(f"Invalid person count: {person!r}")
+    return person
+
+
+class IngestTelemetry:
+    """
+    Counters for message rate, parse time and buffer lag (reset after every report)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.received = 0
+        self.unrouted = 0
+        self.dropped = 0
+        self.parse_errors = 0
+        self.parsed = 0
+        self.parse_time = 0.0
+        self.batches = 0
+        self.max_lag = 0.0
+
+    def record_batch(self, size, parse_time, lag):
+        self.batches += 1
+        self.parsed += size
+        self.parse_time += parse_time
+        self.max_lag = max(self.max_lag, lag)
+
+    def report(self, buffer_depth):
+        """
+        Print telemetry for the current interval and reset counters
+        :param buffer_depth: Number of messages currently buffered
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        avg_parse_us = (self.parse_time / self.parsed * 1e6) if self.parsed else 0.0
+        avg_batch = (self.parsed / self.batches) if self.batches else 0.0
+
+        console.print(f"[blue]MQTT Ingest:[/] {self.received / elapsed:.1f} msg/s, "
+                      f"parse {avg_parse_us:.1f} us/msg (avg batch {avg_batch:.1f}), "
+                      f"max buffer lag {self.max_lag * 1000:.1f} ms, buffered {buffer_depth}, "
+                      f"dropped {self.dropped}, unrouted {self.unrouted}, parse errors {self.parse_errors}")
+        self.reset()
+
+
+class TopicSubscriptions:
+    """
+    Currently subscribed MQTT topics, diffed against the config index so only added or removed topics are
+    (un)subscribed
+    """
+
+    def __init__(self):
+        self.topics = set()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """
+        Forget subscribed topics (broker drops subscriptions with a new session)
+        """
+        with self.lock:
+            self.topics.clear()
+
+    def sync(self, client, index):
+        """
+        Diff subscribed topics against the config index, only (un)subscribe topics that were added or removed
+        :param client: MQTT Local Client
+        :param index: Config index with the desired topics
+        :return: Added topics, removed topics
+        """
+        with self.lock:
+            desired = set(index.topics)
+            added = desired - self.topics
+            removed = self.topics - desired
+
+            # Batch (un)subscribe in a single MQTT packet each
+            if removed:
+                client.unsubscribe(sorted(removed))
+            if added:
+                client.subscribe([(topic, 0) for topic in sorted(added)])
+
+            self.topics.difference_update(removed)
+            self.topics.update(added)
+
+        return added, removed
+
+
+class AsyncioHelper:
+    """
+    Drive the paho MQTT client from an asyncio event loop (socket callbacks instead of paho's network thread)
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        """
+        Handle MQTT keepalive pings and retries (paho loop_misc) once per second
+        """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class MQTTIngest:
+    """
+    Asyncio MQTT front end: route topics to cameras via the config index, buffer raw payloads, parse them in batches
+    and hand person detections to the detection callback
+    """
+
+    def __init__(self, on_event, buffer_size=INGEST_BUFFER_SIZE, batch_size=INGEST_BATCH_SIZE):
+        """
+        :param on_event: Callback taking (serial_number, payload_dict), executed for messages with people detected
+        :param buffer_size: Max messages buffered between the network loop and detection
+        :param batch_size: Max messages parsed per batch
+        """
+        self.on_event = on_event
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.telemetry = IngestTelemetry()
+        self.loop = None
+        self.queue = None
+        self.disconnected = None
+
+        self.client = mqtt.Client()
+        self.client.on_message = self.on_message
+        self.client.on_disconnect = self.on_disconnect
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Schedule callback on the ingest event loop (MQTT client calls from other threads must go through here)
+        :param callback: Function to execute
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_message(self, client, userdata, msg):
+        """
+        Callback when MQTT message received (event loop). Only routes and buffers the raw payload, parsing happens
+        in batches in consume()
+        :param msg: MQTT Message from MV
+        """
+        self.telemetry.received += 1
+
+        # Precomputed topic -> serial routing table from the config index
+        serial_number = ppe_config.current().topics.get(msg.topic)
+        if serial_number is None:
+            self.telemetry.unrouted += 1
+            return
+
+        # Buffer full: drop the oldest message, the newest state of a camera is the one worth acting on
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.telemetry.dropped += 1
+
+        self.queue.put_nowait((serial_number, msg.payload, time.monotonic()))
+
+    def on_disconnect(self, client, userdata, rc):
+        console.print(f"[red]Disconnected from MQTT broker with code: {rc}[/]")
+        self.disconnected.set()
+
+    async def consume(self):
+        """
+        Drain buffered messages in batches, parse payloads and dispatch one person detection per camera per batch
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            start = time.perf_counter()
+            events = {}
+            for serial_number, payload, received in batch:
+                # First message with people detected wins, later messages for the same camera add no information
+                if serial_number in events:
+                    continue
+                try:
+                    payload_dict = orjson.loads(payload)
+                    people = person_count(payload_dict)
+                except (ValueError, TypeError):
+                    # Invalid JSON or malformed counts (orjson.JSONDecodeError is a ValueError)
+                    self.telemetry.parse_errors += 1
+                    continue
+
+                if people > 0:
+                    events[serial_number] = payload_dict
+
+            self.telemetry.record_batch(len(batch), time.perf_counter() - start, time.monotonic() - batch[0][2])
+
+            for serial_number, payload_dict in events.items():
+                try:
+                    self.on_event(serial_number, payload_dict)
+                except Exception as e:
+                    console.print(f"[red]Failed to handle message from camera {serial_number}: {str(e)}[/]")
+
+            # Yield to the network loop between batches
+            await asyncio.sleep(0)
+
+    async def report_telemetry(self, interval):
+        """
+        Periodically print ingest telemetry
+        :param interval: Seconds between reports
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.telemetry.report(self.queue.qsize())
+
+    async def supervise(self, coroutine_function, *args):
+        """
+        Run a background coroutine, restart it if it fails (an unhandled error would otherwise end the task silently
+        and stop detection while MQTT stays connected)
+        :param coroutine_function: Coroutine function to run
+        """
+        while True:
+            try:
+                await coroutine_function(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                console.print(f"[red]MQTT ingest task {coroutine_function.__name__} failed, restarting: {str(e)}[/]")
+                await asyncio.sleep(TASK_RESTART_DELAY)
+
+    async def run(self, host, port, keepalive=60, telemetry_interval=TELEMETRY_INTERVAL):
+        """
+        Connect to the MQTT broker and process messages until cancelled, reconnecting on disconnect
+        :param host: MQTT Server
+        :param port: MQTT Port
+        :param keepalive: MQTT keepalive in seconds
+        :param telemetry_interval: Seconds between telemetry reports
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.buffer_size)
+        self.disconnected = asyncio.Event()
+        AsyncioHelper(self.loop, self.client)
+
+        tasks = [asyncio.create_task(self.supervise(self.consume)),
+                 asyncio.create_task(self.supervise(self.report_telemetry, telemetry_interval))]
+        try:
+            self.client.connect(host, port, keepalive)
+            while True:
+                await self.disconnected.wait()
+                self.disconnected.clear()
+
+                # Reconnect with the same client (on_connect re-subscribes)
+                while True:
+                    await asyncio.sleep(RECONNECT_DELAY)
+                    try:
+                        self.client.reconnect()
+                        break
+                    except OSError as e:
+                        console.print(f"[red]MQTT reconnect failed: {str(e)}[/]")
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+from rich.console import Console
+
+# Shared camera/PPE zone configuration (ppe_app/ppe_config.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ppe_config
+
+# Rich Console Instance
+console = Console()
+
+
+def load_topics():
+    """
+    Get the MV Sense topics routed by the detection app (config index built from cameras.json)
+    :return: List of MQTT topics
+    """
+    return list(ppe_config.current().topics)
+
+
+def main():
+    """
+    Publish synthetic MV zone messages to a (local) MQTT broker to load test the detection ingest front end
+    """
+    parser = argparse.ArgumentParser(description="Publish synthetic MV Sense zone messages to an MQTT broker")
+    parser.add_argument('--host', default='127.0.0.1', help="MQTT broker host")
+    parser.add_argument('--port', type=int, default=1883, help="MQTT broker port")
+    parser.add_argument('--rate', type=int, default=5000, help="Messages per second")
+    parser.add_argument('--duration', type=int, default=60, help="Seconds to publish for")
+    parser.add_argument('--person-ratio', type=float, default=0.0,
+                        help="Fraction of messages reporting a person (each one can trigger a Meraki snapshot)")
+    args = parser.parse_args()
+
+    topics = load_topics()
+    console.print(f"Publishing {args.rate} msg/s for {args.duration}s across {len(topics)} topic(s)...")
+
+    client = mqtt.Client()
+    client.max_queued_messages_set(0)
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    sent = 0
+    start = time.monotonic()
+    end = start + args.duration
+    while time.monotonic() < end:
+        # Publish in 10 ms slices to hold the target rate
+        slice_start = time.monotonic()
+        for _ in range(max(args.rate // 100, 1)):
+            person = 1 if random.random() < args.person_ratio else 0
+            payload = json.dumps({"ts": int(time.time() * 1000), "counts": {"person": person}})
+            client.publish(random.choice(topics), payload)
+            sent += 1
+
+        time.sleep(max(0.01 - (time.monotonic() - slice_start), 0))
+
+    elapsed = time.monotonic() - start
+    client.loop_stop()
+    client.disconnect()
+
+    console.print(f"[green]Published {sent} messages in {elapsed:.1f}s ({sent / elapsed:.0f} msg/s)[/]")
+
+
+if __name__ == "__main__":
+    main()
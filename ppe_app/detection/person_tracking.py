@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import threading
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Minimum IoU between a predicted track box and a person box to continue the track
+TRACK_IOU_THRESHOLD = 0.3
+
+# Frames a track survives without a matching person box
+TRACK_MAX_MISSES = 3
+
+# Seconds a track survives without being seen (a few sampling intervals, shorter than the cool down after a verdict).
+# Tracks never carry over a cool down, so a new person standing where an earlier one stood isn't taken for them
+TRACK_MAX_AGE = 15
+
+# Seconds a person that was alerted on is remembered after they were last seen (longer than the longest cool down,
+# so a person still standing at the same spot in violation after a cool down doesn't trigger a second alert)
+ALERT_MEMORY = 300
+
+# Minimum fraction of a PPE box inside a person box to attach the PPE item to that person
+MIN_CONTAINMENT = 0.5
+
+# Weight of the newest displacement in the track velocity estimate
+VELOCITY_SMOOTHING = 0.5
+
+# Track state before the first evaluation
+UNEVALUATED = 'unevaluated'
+
+
+def outputs_to_xyxy(outputs):
+    """
+    Convert detections ([x_center, y_center, width, height, class_name, prob] per box) to corner boxes
+    :param outputs: Detections from extract_detections
+    :return: Array of shape (N, 4) with x1, y1, x2, y2
+    """
+    if not outputs:
+        return np.zeros((0, 4))
+
+    xywh = np.array([output[:4] for output in outputs], dtype=float)
+    half = xywh[:, 2:] / 2
+    return np.hstack((xywh[:, :2] - half, xywh[:, :2] + half))
+
+
+def _intersections(a, b):
+    """
+    Pairwise intersection areas between two sets of corner boxes
+    :return: Array of shape (len(a), len(b))
+    """
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    return np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+
+
+def _areas(boxes):
+    return np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0, None), axis=1)
+
+
+def iou_matrix(a, b):
+    """
+    Pairwise intersection over union between two sets of corner boxes
+    :param a: Array of shape (N, 4)
+    :param b: Array of shape (M, 4)
+    :return: Array of shape (N, M)
+    """
+    intersections = _intersections(a, b)
+    unions = _areas(a)[:, None] + _areas(b)[None, :] - intersections
+    return np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+
+def containment_matrix(inner, outer):
+    """
+    Pairwise fraction of each inner box (PPE item) covered by each outer box (person)
+    :param inner: Array of shape (N, 4)
+    :param outer: Array of shape (M, 4)
+    :return: Array of shape (N, M)
+    """
+    intersections = _intersections(inner, outer)
+    areas = _areas(inner)[:, None]
+    return np.divide(intersections, areas, out=np.zeros_like(intersections), where=areas > 0)
+
+
+def associate_ppe(person_boxes, ppe_boxes, min_containment=MIN_CONTAINMENT):
+    """
+    Attach each PPE box to the person box containing most of it (IoU breaks ties between overlapping persons)
+    :param person_boxes: Array of shape (P, 4)
+    :param ppe_boxes: Array of shape (N, 4)
+    :param min_containment: Minimum fraction of the PPE box inside the person box
+    :return: Array of shape (N,) with the person index per PPE box, -1 if unassigned
+    """
+    if len(person_boxes) == 0 or len(ppe_boxes) == 0:
+        return np.full(len(ppe_boxes), -1, dtype=int)
+
+    containment = containment_matrix(ppe_boxes, person_boxes)
+    score = containment + 1e-3 * iou_matrix(ppe_boxes, person_boxes)
+
+    assignment = np.argmax(score, axis=1)
+    assignment[containment[np.arange(len(ppe_boxes)), assignment] < min_containment] = -1
+    return assignment
+
+
+class Track:
+    """
+    Tracked person with cached PPE compliance state
+    """
+    __slots__ = ('track_id', 'box', 'velocity', 'hits', 'misses', 'last_seen', 'ppe_classes', 'state', 'alerted')
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.velocity = np.zeros(4)
+        self.hits = 1
+        self.misses = 0
+        self.last_seen = time.monotonic()
+        self.ppe_classes = None
+        self.state = UNEVALUATED
+        self.alerted = False
+
+    def predict(self):
+        """
+        Predicted box in the next frame (constant velocity)
+        """
+        return self.box + self.velocity
+
+    def update(self, box):
+        self.velocity = VELOCITY_SMOOTHING * (box - self.box) + (1 - VELOCITY_SMOOTHING) * self.velocity
+        self.box = box
+        self.hits += 1
+        self.misses = 0
+        self.last_seen = time.monotonic()
+
+
+class PersonTracker:
+    """
+    SORT-style tracker: constant velocity prediction, IoU matching with optimal assignment
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_misses=TRACK_MAX_MISSES, max_age=TRACK_MAX_AGE,
+                 alert_memory=ALERT_MEMORY):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.max_age = max_age
+        self.alert_memory = alert_memory
+        self.tracks = []
+        self.next_id = 1
+
+        # Last boxes of expired tracks that were alerted on, with the time they are forgotten
+        self.alerted_boxes = []
+
+    def _drop(self, expired):
+        """
+        Drop expired tracks, remember the last box of the ones that were alerted on
+        :param expired: Function taking a track, True if it should be dropped
+        """
+        tracks = []
+        for track in self.tracks:
+            if not expired(track):
+                tracks.append(track)
+            elif track.alerted:
+                self.alerted_boxes.append((track.box, track.last_seen + self.alert_memory))
+        self.tracks = tracks
+
+    def _recall_alert(self, box):
+        """
+        Check if a new track is at the spot of an expired track that was alerted on (consumes the memory entry)
+        :param box: Box of the new track
+        :return: True if already alerted on
+        """
+        if not self.alerted_boxes:
+            return False
+
+        iou = iou_matrix(box[None, :], np.array([alerted_box for alerted_box, _ in self.alerted_boxes]))[0]
+        best = int(np.argmax(iou))
+        if iou[best] < self.iou_threshold:
+            return False
+
+        del self.alerted_boxes[best]
+        return True
+
+    def _match(self, person_boxes):
+        """
+        Match person boxes to existing tracks
+        :param person_boxes: Array of shape (P, 4)
+        :return: List of the track per person box (None if unmatched)
+        """
+        matches = [None] * len(person_boxes)
+        if not self.tracks or len(person_boxes) == 0:
+            return matches
+
+        predicted = np.array([track.predict() for track in self.tracks])
+        iou = iou_matrix(person_boxes, predicted)
+        rows, cols = linear_sum_assignment(-iou)
+
+        for row, col in zip(rows, cols):
+            if iou[row, col] >= self.iou_threshold:
+                matches[row] = self.tracks[col]
+        return matches
+
+    def update(self, person_boxes, outputs, evaluate):
+        """
+        Track persons in a new frame, attach PPE detections to them and re-evaluate compliance for new tracks or
+        tracks whose PPE changed
+        :param person_boxes: Array of shape (P, 4) with person corner boxes
+        :param outputs: PPE detections from extract_detections
+        :param evaluate: Function mapping a person's PPE class names to a PPE state (True, False, None)
+        :return: Tracks of the persons in this frame (same order as person_boxes), tracks re-evaluated this frame,
+        PPE detections not attached to any person
+        """
+        # Drop tracks not seen recently before matching (ex: after a cool down or an empty zone)
+        now = time.monotonic()
+        self._drop(lambda track: track.last_seen < now - self.max_age)
+        self.alerted_boxes = [(box, forget_at) for box, forget_at in self.alerted_boxes if forget_at > now]
+
+        matches = self._match(person_boxes)
+
+        frame_tracks = []
+        for box, track in zip(person_boxes, matches):
+            if track is None:
+                track = Track(self.next_id, box)
+                self.next_id += 1
+
+                # Same spot as a person already alerted on (ex: still standing there after the cool down)
+                track.alerted = self._recall_alert(box)
+                self.tracks.append(track)
+            else:
+                track.update(box)
+            frame_tracks.append(track)
+
+        # Age out tracks that weren't seen in this frame
+        seen = set(id(track) for track in frame_tracks)
+        for track in self.tracks:
+            if id(track) not in seen:
+                track.misses += 1
+        self._drop(lambda track: track.misses > self.max_misses)
+
+        # Attach PPE items to persons, only evaluate tracks that are new or whose PPE items changed
+        assignment = associate_ppe(person_boxes, outputs_to_xyxy(outputs))
+        evaluated = []
+        for person_index, track in enumerate(frame_tracks):
+            ppe_classes = frozenset(outputs[i][4] for i in np.flatnonzero(assignment == person_index))
+            if track.state is UNEVALUATED or ppe_classes != track.ppe_classes:
+                track.ppe_classes = ppe_classes
+                track.state = evaluate(ppe_classes)
+
+                # Compliant again, a later violation is a new event
+                if track.state is True:
+                    track.alerted = False
+                evaluated.append(track)
+
+        unassigned = [outputs[i] for i in np.flatnonzero(assignment == -1)]
+        return frame_tracks, evaluated, unassigned
+
+
+def aggregate_state(tracks):
+    """
+    Frame PPE state from the persons in it: Invalid if anyone is in violation, Valid only if everyone is compliant
+    :param tracks: Tracks of the persons in the frame
+    :return: True, False or None
+    """
+    states = [track.state for track in tracks]
+    if False in states:
+        return False
+    if states and all(state is True for state in states):
+        return True
+    return None
+
+
+def unalerted_violations(tracks):
+    """
+    Get tracks that haven't triggered an alert yet, and mark them alerted
+    :param tracks: Tracks seen in violation
+    :return: List of tracks
+    """
+    violations = [track for track in tracks if not track.alerted]
+    for track in violations:
+        track.alerted = True
+    return violations
+
+
+# Trackers per camera serial
+_trackers = {}
+_lock = threading.Lock()
+
+
+def get_tracker(serial_number):
+    """
+    Get (or create) person tracker for a camera
+    :param serial_number: MV Camera Serial
+    :return: PersonTracker
+    """
+    with _lock:
+        if serial_number not in _trackers:
+            _trackers[serial_number] = PersonTracker()
+        return _trackers[serial_number]
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import argparse
+import csv
+import importlib.util
+import os
+import sys
+import time
+
+import cv2
+from rich.console import Console
+
+# Shared camera/PPE zone configuration (ppe_app/ppe_config.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ppe_config
+from annotation import Annotator, JPEG_QUALITY
+from frame_decode import parallel_decode
+
+# Rich Console Instance
+console = Console()
+
+# File extensions treated as video files and images
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.m4v')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Sampled frames decoded per worker task
+FRAMES_PER_TASK = 16
+
+# Report columns
+REPORT_FIELDS = ['source', 'frame_index', 'timestamp_seconds', 'ppe_state', 'detected_classes', 'annotated_path']
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# PPE state names (as displayed on the dashboard)
+STATE_NAMES = {True: 'Valid', False: 'Invalid', None: 'Unknown'}
+
+
+def iter_sources(inputs):
+    """
+    Expand input paths (video files, images, directories) into individual video and image files
+    :param inputs: List of file/directory paths
+    :return: Generator of (kind, path) tuples, kind is 'video' or 'image'
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                yield from iter_sources([os.path.join(path, name)])
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            yield 'video', path
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield 'image', path
+
+
+def iter_tasks(inputs, sample_seconds, image_stride):
+    """
+    Split sources into decode tasks of at most FRAMES_PER_TASK sampled frames (lets workers decode one video in
+    parallel)
+    :param inputs: List of file/directory paths
+    :param sample_seconds: Seconds between sampled video frames
+    :param image_stride: Use every Nth image of image folders
+    :return: Generator of decode tasks
+    """
+    images = []
+    image_index = 0
+    for kind, path in iter_sources(inputs):
+        if kind == 'image':
+            if image_index % image_stride == 0:
+                images.append((path, image_index))
+            image_index += 1
+
+            if len(images) == FRAMES_PER_TASK:
+                yield 'image', images
+                images = []
+            continue
+
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        if frame_count <= 0:
+            console.print(f"[red]Unable to read video, skipping: {path}[/]")
+            continue
+
+        step = max(int(round(fps * sample_seconds)), 1)
+        segment = step * FRAMES_PER_TASK
+        for start in range(0, frame_count, segment):
+            yield 'video', (path, fps, step, start, min(start + segment, frame_count))
+
+    if images:
+        yield 'image', images
+
+
+def batched(frames, batch_size):
+    """
+    Group frames into inference batches
+    :param frames: Generator of decoded frames
+    :param batch_size: Frames per batch
+    :return: Generator of frame lists
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_parquet(report_path):
+    return report_path.lower().endswith('.parquet')
+
+
+class ReportWriter:
+    """
+    Write audit rows to CSV or Parquet (requires pyarrow), both streamed to disk while the audit runs
+    """
+
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.parquet = is_parquet(report_path)
+        self.rows = []
+
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            self.pa = pa
+            self.schema = pa.schema([('source', pa.string()), ('frame_index', pa.int64()),
+                                     ('timestamp_seconds', pa.float64()), ('ppe_state', pa.string()),
+                                     ('detected_classes', pa.string()), ('annotated_path', pa.string())])
+            self.writer = pq.ParquetWriter(report_path, self.schema)
+        else:
+            self.fp = open(report_path, 'w', newline='')
+            self.writer = csv.DictWriter(self.fp, fieldnames=REPORT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.parquet:
+            self.rows.append(row)
+            if len(self.rows) >= PARQUET_ROW_GROUP_SIZE:
+                self.flush()
+        else:
+            self.writer.writerow(row)
+
+    def flush(self):
+        """
+        Write buffered Parquet rows as a row group
+        """
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        if self.parquet:
+            self.flush()
+            self.writer.close()
+        else:
+            self.fp.close()
+
+
+def annotated_file_name(source, frame_index):
+    """
+    Build unique file name for an annotated violation frame
+    :param source: Source video/image path
+    :param frame_index: Frame (or image) index
+    :return: File name
+    """
+    base_name = os.path.splitext(os.path.basename(source))[0]
+    return f"{base_name}_{frame_index:07d}_annotated.jpeg"
+
+
+def run_audit(inputs, policy, report_path, annotated_dir, sample_seconds, image_stride, batch_size, workers,
+              annotator):
+    """
+    Run PPE detection over archived footage/image folders, write report and annotated violation frames
+    :return: Counts per PPE state
+    """
+    # Imported here, spawned decode workers re-import this module and only need OpenCV
+    import torch
+    from ppe_inference import CONFIDENCE, load_model, extract_detections, detect_ppe_state
+
+    # Inference gets the cores not used by decode workers (avoids oversubscribing the CPU)
+    torch.set_num_threads(max((os.cpu_count() or 1) - workers, 1))
+
+    os.makedirs(annotated_dir, exist_ok=True)
+    model = load_model()
+    report = ReportWriter(report_path)
+
+    state_counts = {name: 0 for name in STATE_NAMES.values()}
+    processed = 0
+    start = time.monotonic()
+    last_report = start
+
+    try:
+        frames = parallel_decode(iter_tasks(inputs, sample_seconds, image_stride), workers)
+        for batch in batched(frames, batch_size):
+            results = model.predict([frame for _, _, _, frame in batch], conf=CONFIDENCE, verbose=False)
+
+            for (source, frame_index, timestamp, frame), result in zip(batch, results):
+                outputs, classes = extract_detections(result, policy)
+                ppe_state = detect_ppe_state(classes, policy)
+
+                # Only violations are annotated and saved
+                annotated_path = ''
+                if ppe_state is False:
+                    annotated_path = os.path.join(annotated_dir, annotated_file_name(source, frame_index))
+                    annotator.write(annotated_path, frame, outputs)
+
+                report.write({'source': source, 'frame_index': frame_index, 'timestamp_seconds': timestamp,
+                              'ppe_state': STATE_NAMES[ppe_state], 'detected_classes': '|'.join(classes),
+                              'annotated_path': annotated_path})
+                state_counts[STATE_NAMES[ppe_state]] += 1
+
+            processed += len(batch)
+            now = time.monotonic()
+            if now - last_report >= 10:
+                console.print(f"Processed {processed} frames ({processed / (now - start):.1f} frames/sec)")
+                last_report = now
+    finally:
+        report.close()
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    console.print(f"[green]Audit complete:[/] {processed} frames in {elapsed:.1f}s "
+                  f"([blue]{processed / elapsed:.1f} frames/sec[/])")
+    return state_counts
+
+
+def main():
+    """
+    Batch/offline audit mode entry point
+    """
+    parser = argparse.ArgumentParser(description="Run PPE detection over archived MV footage or snapshot folders")
+    parser.add_argument('inputs', nargs='+', help="Video files, images or directories of either")
+    policy_group = parser.add_mutually_exclusive_group(required=True)
+    policy_group.add_argument('--zone', help="PPE zone name (ppe_zones.json) to enforce")
+    policy_group.add_argument('--camera', help="Camera serial (cameras.json), enforce its PPE zone")
+    parser.add_argument('--report', default='ppe_audit_report.csv', help="Report path (.csv or .parquet)")
+    parser.add_argument('--annotated-dir', default='ppe_audit_violations', help="Folder for annotated violations")
+    parser.add_argument('--sample-seconds', type=float, default=1.0, help="Seconds between sampled video frames")
+    parser.add_argument('--image-stride', type=int, default=1, help="Use every Nth image of image folders")
+    parser.add_argument('--batch-size', type=int, default=8, help="Frames per inference batch")
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 1) // 2, 1),
+                        help="Decode worker processes (remaining cores are used for inference)")
+    parser.add_argument('--output-width', type=int, help="Width of annotated frames (default: full resolution)")
+    parser.add_argument('--jpeg-quality', type=int, default=JPEG_QUALITY, help="JPEG quality of annotated frames")
+    args = parser.parse_args()
+
+    # Determine zone policy
+    index = ppe_config.current()
+    if args.camera:
+        camera = index.cameras.get(args.camera)
+        policy = camera.policy if camera is not None else None
+    else:
+        policy = index.zones.get(args.zone)
+
+    if policy is None:
+        console.print('[red]PPE Zone not defined for camera/zone name, unable to run audit...[/]')
+        sys.exit(1)
+
+    # Check before processing any footage, not when the report is first written
+    if is_parquet(args.report) and importlib.util.find_spec('pyarrow') is None:
+        console.print('[red]Parquet report requires pyarrow (pip install pyarrow), unable to run audit...[/]')
+        sys.exit(1)
+
+    console.print(f"[blue]PPE Zone:[/] {policy.name}, [blue]Workers:[/] {args.workers}, "
+                  f"[blue]Batch Size:[/] {args.batch_size}")
+
+    state_counts = run_audit(args.inputs, policy, args.report, args.annotated_dir, args.sample_seconds,
+                             max(args.image_stride, 1), args.batch_size, max(args.workers or 1, 1),
+                             Annotator(args.output_width, args.jpeg_quality))
+
+    console.print(f"Valid: [green]{state_counts['Valid']}[/], Invalid: [red]{state_counts['Invalid']}[/], "
+                  f"Unknown: {state_counts['Unknown']}")
+    console.print(f"Report written to [blue]{args.report}[/]")
+
+
+if __name__ == "__main__":
+    main()
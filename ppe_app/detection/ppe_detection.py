@@ -16,9 +16,11 @@ __author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
 __copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
 __license__ = "Cisco Sample Code License, Version 1.1"
 
+import asyncio
 import json
 import os
 import shutil
+import sys
 import threading
 import time
 import uuid
@@ -26,15 +28,22 @@ from datetime import datetime
 
 import cv2
 import meraki
-import paho.mqtt.client as mqtt
 import requests
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.panel import Panel
-from ultralytics import YOLO
 
 import config
 
+# Shared camera/PPE zone configuration (ppe_app/ppe_config.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ppe_config
+import mqtt_ingest
+import temporal_voting
+import person_tracking
+from annotation import Annotator
+from ppe_inference import CONFIDENCE, load_model, extract_detections, extract_person_boxes, detect_ppe_state
+
 # Load Environment Variables
 load_dotenv()
 MERAKI_API_KEY = os.getenv("MERAKI_API_KEY")
@@ -47,39 +56,25 @@ console = Console()
 # Meraki Dashboard Instance
 dashboard = meraki.DashboardAPI(MERAKI_API_KEY, suppress_logging=True)
 
-# Configure global dictionaries
-CAMERAS = {}
-ZONE_PPE = {}
-
 # Absolute path to parent directory
 current_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.dirname(current_directory)
 
-# YOLOv8 ML Model File
-MODEL = YOLO(f"{current_directory}/ppe_dataset/weights/best.pt")
+# YOLOv8 ML Model
+MODEL = load_model()
 
-# Minimum confidence threshold for detections
-CONFIDENCE = 0.5
+# Annotated snapshot renderer (full resolution, attached to Microsoft Teams messages)
+ANNOTATOR = Annotator()
 
 # Define a dictionary to keep track of active threads
 active_threads = {}
 
-# Read in JSON Data Files, populate Global dictionaries
-with open(f'{parent_directory}/cameras.json', 'r') as cam_fp, open(f'{parent_directory}/ppe_zones.json', 'r') as zone_fp:
-    ppe_zones = json.load(zone_fp)
-    cameras = json.load(cam_fp)
+# MQTT ingest front end and currently subscribed topics (diffed against the config index on reload)
+ingest = None
+subscriptions = mqtt_ingest.TopicSubscriptions()
 
-    # Build ppe zones
-    for zone in ppe_zones:
-        zone_name = zone['ppe_zone_name']
-        del zone['ppe_zone_name']
-        ZONE_PPE[zone_name] = zone['ppe_items']
-
-    # Add Cameras
-    for camera in cameras:
-        serial = camera['serial']
-        del camera['serial']
-        CAMERAS[serial] = camera
+# Read in JSON Data Files (fail fast on startup if they are missing or invalid)
+ppe_config.current()
 
 # Create Snapshots directory
 os.makedirs(f'{parent_directory}/snapshots', exist_ok=True)
@@ -150,36 +145,14 @@ def send_annotated_image_to_hosted_app(image_file_path, annotated_hosted_name):
     else:
         print("Failed to send the image to the other app.")
 
-def create_label(img, color, class_name, confidence, top_left):
-    """
-    Create label for bounding box in annotated image
-    :param img: Source Image with bounding boxes
-    :param color: Label color
-    :param class_name: Label name
-    :param confidence: Label confidence percentage (for display)
-    :param top_left: Top left corner of bounding box
-    :return: Image with labels attached to the top left corner of bounding boxes
-    """
-    # For the text background
-    text = class_name + " " + str(round(confidence * 100, 2)) + "%"
-
-    # Finds space required by the text so that we can put a background with that amount of width.
-    (w, h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
-
-    # Prints the text
-    img = cv2.rectangle(img, (top_left[0], top_left[1] - 40), (top_left[0] + w, top_left[1]), color, -1)
-    img = cv2.putText(img, text, (top_left[0], top_left[1] - 5),
-                      cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-    return img
-
-
-def detect_ppe_on_image(serial_number, snapshot_path, required_ppe):
+def detect_ppe_on_image(serial_number, snapshot_path, policy):
     """
     Run YOLOv8 prediction on image (MV snapshot)
     :param serial_number: MV serial number (image path name)
     :param snapshot_path: Path to raw MV snapshot
-    :param required_ppe: Required PPE dictionary
-    :return: Detected classes (to determine ppe violation)
+    :param policy: Compiled PPE zone policy
+    :return: Detections ([x_center, y_center, width, height, class_name, prob] per box), detected classes (to
+    determine ppe violation), person boxes
     """
     # Run prediction on image with YOLO model
     results = MODEL.predict(snapshot_path, conf=CONFIDENCE)
@@ -188,178 +161,169 @@ def detect_ppe_on_image(serial_number, snapshot_path, required_ppe):
     # Open image to apply boxes
     img = cv2.imread(snapshot_path)
 
-    # Extract the bounding box coordinates and dimensions (normalized by image size), extract the class name,
-    # extract detection prob
-    outputs = []
-    classes = []
-    for box in result.boxes:
-        # class id (box id), translated class name
-        class_id = box.cls[0].item()
-        class_name = result.names[class_id]
-
-        # Ignore 'Person Class' to clean up image, ignore PPE items we aren't enforcing in this zone (both no and
-        # normal versions of class)
-        ppe_comparison = class_name.replace('No', '').strip()
-        if class_name == 'Person' or (ppe_comparison in required_ppe and required_ppe[ppe_comparison] == False):
-            continue
-
-        # class prob(box probability)
-        prob = round(box.conf[0].item(), 2)
-
-        # Centroid X,Y and width/height of bounding box normalized to image size
-        x1, y1, nw, nh = [
-            round(x) for x in box.xywh[0].tolist()
-        ]
-
-        outputs.append([
-            x1, y1, nw, nh, class_name, prob
-        ])
-
-        classes.append(class_name)
-
-    # Create boxes and labels for valid classes on this camera
-    for output in outputs:
-        # Calculate top_left and bottom_right of bounding box for drawing boxes
-        top_left = (int(output[0] - output[2] / 2), int(output[1] - output[3] / 2))
-        bottom_right = (int(output[0] + output[2] / 2), int(output[1] + output[3] / 2))
-
-        # Create Box (green for PPE item, red for 'No' ppe classes), add label (name, percentage detection)
-        if 'No' in output[4]:
-            color = (0, 0, 255)
-            cv2.rectangle(img, top_left, bottom_right, color, 3)
-
-            # Attach class label and confidence label
-            img = create_label(img, color, output[4], output[5], top_left)
-        else:
-            color = (0, 255, 0)
-            cv2.rectangle(img, top_left, bottom_right, color, 3)
+    # Extract the bounding box coordinates and dimensions, class names and detection probs for this zone, draw them
+    outputs, classes = extract_detections(result, policy)
+    person_boxes = extract_person_boxes(result)
 
-            # Attach class label and confidence label
-            img = create_label(img, color, output[4], output[5], top_left)
+    # Draw boxes and labels, save image output to snapshots folder
+    ANNOTATOR.write(f'{parent_directory}/snapshots/{serial_number}_snapshot_annotated.jpeg', img, outputs)
 
-    # Save image output to snapshots folder
-    cv2.imwrite(f'{parent_directory}/snapshots/{serial_number}_snapshot_annotated.jpeg', img)
-
-    return classes
-
-
-def detect_ppe_state(ppe_detected, required_ppe):
-    """
-    Determine if all PPE is present in desired zone or not (adjust 'state' - Valid, Invalid, Unknown appropriately)
-    :param ppe_detected: PPE classes detected in image
-    :param required_ppe: Required PPE dictionary to check
-    :return: Boolean representing if all PPE is present
-    """
-    # Extract the object names with value 1 from the dictionary
-    ppe_to_check = [key for key, value in required_ppe.items() if value == True]
-
-    # Check if a PPE Violation is detected - No Class (Case 1):
-    no_class_present = any('No' in item for item in ppe_detected)
-    if no_class_present:
-        return False
-
-    # Check if all PPE is present (Case 2)
-    if len(ppe_detected) > 0:
-        all_ppe_present = all(item in ppe_to_check for item in ppe_detected)
-
-        # Determine if proper PPE worn (based on zone)
-        if all_ppe_present:
-            return True
-
-    # Unable to determine if all PPE detected (ex: not all objects could be reasonably detected, no objects present)
-    return None
+    return outputs, classes, person_boxes
 
 
 def process_message(serial_number, payload_dict):
     """
-    Start processing received detection of a person from MQTT server, generate snapshot and run detection model -
-    main driver - executed via thread to not block main MQTT thread
+    Start processing received detection of a person from MQTT server, generate snapshots and run detection model until
+    the camera's sliding window reaches a k-of-n verdict - main driver - executed via thread to not block main MQTT
+    thread
     :param serial_number: MV Serial number where person is detected
     :param payload_dict: MQTT message payload
     """
-    # Determine correct ppe for zone associated to camera
-    if serial_number in CAMERAS:
-        ppe_zone_name = CAMERAS[serial_number]["ppe_zone_name"]
+    try:
+        # Determine correct ppe for zone associated to camera (snapshot of config, unaffected by a reload mid-run)
+        camera = ppe_config.current().cameras.get(serial_number)
+        if camera is None:
+            console.print('[red]No PPE Zone Defined for Camera, skipping detection...[/]')
+            return
 
-        if ppe_zone_name in ZONE_PPE:
-            required_ppe = ZONE_PPE[ppe_zone_name]
+        if camera.policy is None:
+            console.print('[red]PPE Zone name not defined, skipping detection...[/]')
+            return
 
-            console.print(Panel.fit("Running Image Prediction:", title='Step 1'))
-            console.print(f"[blue]Camera:[/] {serial_number}, [blue]PPE Zone:[/] {ppe_zone_name}")
+        console.print(Panel.fit("Running Image Prediction:", title='Step 1'))
+        console.print(f"[blue]Camera:[/] {serial_number}, [blue]PPE Zone:[/] {camera.ppe_zone_name}")
 
+        # Sample frames until k of the last n frames agree (one occluded item doesn't decide the verdict), sampling
+        # faster while the state is uncertain
+        window = temporal_voting.get_window(serial_number)
+        tracker = person_tracking.get_tracker(serial_number)
+
+        # Persons seen in violation during this run (alerts are based on these, not only on the last frame)
+        violating_tracks = {}
+        untracked_violation = False
+        for sample in range(1, window.size + 1):
             # Generate and download snapshot
             image_url = generate_snapshot(serial_number)
             snapshot_path = download_file(f'{serial_number}_snapshot', image_url, f'{parent_directory}/snapshots')
 
             # Run Inference logic here (detect ppe! - where the magic happens!)
-            ppe_detected = detect_ppe_on_image(serial_number, snapshot_path, required_ppe)
-            ppe_state = detect_ppe_state(ppe_detected, required_ppe)
+            outputs, ppe_detected, person_boxes = detect_ppe_on_image(serial_number, snapshot_path, camera.policy)
 
-            console.print(Panel.fit("PPE Verdict (Microsoft Teams Message)", title='Step 2'))
+            # Attach PPE items to tracked persons, only new persons or persons whose PPE changed are re-evaluated
+            frame_tracks, evaluated, unassigned = tracker.update(
+                person_boxes, outputs, lambda classes: detect_ppe_state(classes, camera.policy))
 
-            if ppe_state is False:
-                console.print('[red]PPE Violation detected! One or more zone items is missing...[/]')
+            # Judge each person when persons are detected, otherwise fall back to the whole frame. Violation items
+            # not attached to any person (ex: person box missed or cut off) still make the frame a violation
+            if frame_tracks:
+                frame_state = person_tracking.aggregate_state(frame_tracks)
+                unassigned_violation = detect_ppe_state([output[4] for output in unassigned], camera.policy) is False
+            else:
+                frame_state = detect_ppe_state(ppe_detected, camera.policy)
+                unassigned_violation = frame_state is False
 
-                # Copy annotated result image to hosted_images folder with unique id (to guarantee uniqueness)
-                unique_id = str(uuid.uuid4())[:8]
+            if unassigned_violation:
+                frame_state = False
+                untracked_violation = True
+            window.add(frame_state, outputs)
 
-                image_name = snapshot_path.split('/')[-1].split('.jpeg')[0]
-                annotated_name = image_name + '_annotated.jpeg'
-                annotated_hosted_name = image_name + f'_hosted_{unique_id}.jpeg'
+            if frame_state is False:
+                violating_tracks.update((track.track_id, track) for track in frame_tracks if track.state is False)
 
-                # Try to send image to hosting app
-                try:
-                    send_annotated_image_to_hosted_app(f'{parent_directory}/snapshots/{annotated_name}', annotated_hosted_name)
-                except Exception as e:
-                    console.print(f'Unable to send image to hosting app: {str(e)}')
+            verdict = window.verdict()
+            console.print(f"Frame {sample}/{window.size}: state [blue]{frame_state}[/], "
+                          f"{len(frame_tracks)} person(s) ({len(evaluated)} re-evaluated), "
+                          f"window verdict [blue]{verdict}[/] ({window.agreement}-of-{window.size})")
 
-                # On violation, send Microsoft Teams message
-                console.print('Sending Microsoft teams message...')
-                send_microsoft_teams_message(serial_number, annotated_hosted_name)
-            elif ppe_state is True:
-                console.print('[green]All PPE is present for this zone![/]')
-            else:
-                console.print('Unable to determine if full PPE is present...')
+            if verdict is not temporal_voting.PENDING or sample == window.size:
+                break
 
-            # Send State Update to API Endpoint on Flask App
-            try:
-                flask_app_url = f"{config.VISUALIZATION_APP_URL}/update_state"
-                state_data = {"ppe_state": ppe_state}
+            time.sleep(window.next_interval())
 
-                console.print(f"Updating PPE State to [blue]{ppe_state}[/]...")
+        console.print(f"Detected classes (count, mean confidence): {window.summary()}")
 
-                response = requests.post(flask_app_url, json=state_data)
+        if verdict is temporal_voting.PENDING:
+            console.print('No agreement between recent frames, skipping verdict...')
+        else:
+            # Only alert for tracked persons that haven't been alerted on yet (untracked violations always alert)
+            send_alert = True
+            if verdict is False and violating_tracks and not untracked_violation:
+                violations = person_tracking.unalerted_violations(violating_tracks.values())
+                send_alert = len(violations) > 0
+                console.print(f"Persons in violation (new): {[track.track_id for track in violations]}")
 
-                if response.status_code == 200:
-                    console.print("- [green]State successfully sent to flask app[/]")
-                else:
-                    console.print(f"- [red]Failed to update state, status code: {response.status_code}[/]")
+            report_verdict(camera, snapshot_path, verdict, send_alert)
 
-            except Exception as e:
-                console.print(f"- [red]Failed to update state, error: {str(e)}[/]")
+        # Sleep to prevent spam processing (backs off while the verdict stays the same)
+        sleep_time = window.record_verdict(verdict)
 
-            # Sleep to prevent spam processing
-            sleep_time = 20
+        console.print(f'Waiting for {sleep_time} seconds...')
+        time.sleep(sleep_time)
+    finally:
+        # Remove the thread entry from the active_threads dictionary when done
+        active_threads.pop(serial_number, None)
 
-            console.print(f'Waiting for {sleep_time} seconds...')
-            time.sleep(sleep_time)
 
-            # Remove the thread entry from the active_threads dictionary when done
-            del active_threads[serial_number]
-        else:
-            console.print('[red]PPE Zone name not defined, skipping detection...[/]')
+def report_verdict(camera, snapshot_path, ppe_state, send_alert=True):
+    """
+    Act on a confirmed PPE verdict: send Microsoft Teams message on violation, update state on Flask App
+    :param camera: MV camera (config index entry)
+    :param snapshot_path: Path to the most recent raw MV snapshot (annotated version is attached to messages)
+    :param ppe_state: Confirmed PPE state
+    :param send_alert: Send Microsoft Teams message on violation (False if already alerted for these persons)
+    """
+    console.print(Panel.fit("PPE Verdict (Microsoft Teams Message)", title='Step 2'))
+
+    if ppe_state is False and not send_alert:
+        console.print('[red]PPE Violation detected![/] Already alerted for these person(s), skipping message...')
+    elif ppe_state is False:
+        console.print('[red]PPE Violation detected! One or more zone items is missing...[/]')
+
+        # Copy annotated result image to hosted_images folder with unique id (to guarantee uniqueness)
+        unique_id = str(uuid.uuid4())[:8]
+
+        image_name = snapshot_path.split('/')[-1].split('.jpeg')[0]
+        annotated_name = image_name + '_annotated.jpeg'
+        annotated_hosted_name = image_name + f'_hosted_{unique_id}.jpeg'
+
+        # Try to send image to hosting app
+        try:
+            send_annotated_image_to_hosted_app(f'{parent_directory}/snapshots/{annotated_name}', annotated_hosted_name)
+        except Exception as e:
+            console.print(f'Unable to send image to hosting app: {str(e)}')
+
+        # On violation, send Microsoft Teams message
+        console.print('Sending Microsoft teams message...')
+        send_microsoft_teams_message(camera, annotated_hosted_name)
+    elif ppe_state is True:
+        console.print('[green]All PPE is present for this zone![/]')
     else:
-        console.print('[red]No PPE Zone Defined for Camera, skipping detection...[/]')
+        console.print('Unable to determine if full PPE is present...')
+
+    # Send State Update to API Endpoint on Flask App
+    try:
+        flask_app_url = f"{config.VISUALIZATION_APP_URL}/update_state"
+        state_data = {"ppe_state": ppe_state}
+
+        console.print(f"Updating PPE State to [blue]{ppe_state}[/]...")
 
+        response = requests.post(flask_app_url, json=state_data)
 
-def send_microsoft_teams_message(serial_number, annotated_hosted_name):
+        if response.status_code == 200:
+            console.print("- [green]State successfully sent to flask app[/]")
+        else:
+            console.print(f"- [red]Failed to update state, status code: {response.status_code}[/]")
+
+    except Exception as e:
+        console.print(f"- [red]Failed to update state, error: {str(e)}[/]")
+
+
+def send_microsoft_teams_message(camera, annotated_hosted_name):
     """
     Send Microsoft Teams message when a PPE violation has been detected (include image, use default.json card)
-    :param serial_number: MV camera serial where violation was detected
+    :param camera: MV camera (config index entry) where violation was detected
     :param annotated_hosted_name: Name of image file hosted locally in flask app for display in adaptive card
     """
-    camera_data = CAMERAS[serial_number]
-
     # Load card file
     with open(f'{current_directory}/cards/default_card.json', "r") as json_file:
         card_payload = json.load(json_file)
@@ -370,9 +334,9 @@ def send_microsoft_teams_message(serial_number, annotated_hosted_name):
 
     # Plug in values into payload
     card_payload['body'][1]['text'] = formatted_datetime
-    card_payload['body'][2]['columns'][0]['items'][0]['facts'][0]['value'] = serial_number
-    card_payload['body'][2]['columns'][0]['items'][0]['facts'][1]['value'] = camera_data['camera_location']
-    card_payload['body'][2]['columns'][1]['items'][0]['facts'][0]['value'] = camera_data['ppe_zone_name']
+    card_payload['body'][2]['columns'][0]['items'][0]['facts'][0]['value'] = camera.serial
+    card_payload['body'][2]['columns'][0]['items'][0]['facts'][1]['value'] = camera.camera_location
+    card_payload['body'][2]['columns'][1]['items'][0]['facts'][0]['value'] = camera.ppe_zone_name
 
     # Determine Image Path
     card_payload['body'][3]['url'] = f"{config.SERVE_IMAGES_URL}/serve_image/{annotated_hosted_name}"
@@ -404,48 +368,72 @@ def on_connect(client, userdata, flags, rc):
     :param rc: MQTT Connection Code
     """
     console.print("Connected with code: " + str(rc))
-    for camera in CAMERAS:
-        if CAMERAS[camera]['camera_zone_id'] != '':
-            camera_zone = CAMERAS[camera]['camera_zone_id']
-        else:
-            camera_zone = '0'
 
-        client.subscribe("/merakimv/" + camera + '/' + camera_zone)
+    # Broker drops subscriptions with a new session, subscribe to every configured topic again
+    subscriptions.reset()
+    sync_subscriptions(client, ppe_config.current())
+
+
+def sync_subscriptions(client, index):
+    """
+    Diff subscribed MQTT topics against the config index, only (un)subscribe topics that were added or removed
+    :param client: MQTT Local Client
+    :param index: Config index with the desired topics
+    """
+    added, removed = subscriptions.sync(client, index)
+    if added or removed:
+        console.print(f"MQTT subscriptions updated: [green]+{len(added)}[/] / [red]-{len(removed)}[/]")
 
 
-def on_message(client, userdata, msg):
+def on_config_reload(old_index, new_index):
     """
-    Callback when MQTT message received. Check if a person has been detected. If detected, run PPE detection algorithm
-    :param msg: MQTT Message from MV
+    Config listener, apply new camera topics to the live MQTT session without reconnecting
+    :param old_index: Previous config index
+    :param new_index: New config index
     """
-    payload = msg.payload.decode("utf-8")
-    payload_dict = json.loads(payload)
+    if ingest is not None:
+        # MQTT client is driven by the ingest event loop, (un)subscribe from there
+        ingest.call_soon_threadsafe(sync_subscriptions_if_connected, ingest.client, new_index)
 
-    # Extract the camera SN from the mqtt topic header and use it to generate MV snapshot. Generate
-    # the time of snapshot by converting the epoc time in the mqtt message
-    # create a payload of url, mv name, time of trigger and serial number:
-    serial_number = msg.topic.split("/")[2]
 
+def sync_subscriptions_if_connected(client, index):
+    """
+    Sync MQTT subscriptions if connected (otherwise on_connect subscribes to the current index)
+    :param client: MQTT Local Client
+    :param index: Config index with the desired topics
+    """
+    if client.is_connected():
+        sync_subscriptions(client, index)
+
+
+def handle_event(serial_number, payload_dict):
+    """
+    Ingest callback when a person has been detected on a camera. If no detection is running for the camera, run PPE
+    detection algorithm in a new thread (keeps the MQTT event loop free)
+    :param serial_number: MV Serial number where person is detected
+    :param payload_dict: Parsed MQTT message payload
+    """
     # Check if a thread is already active for the serial number
     if serial_number not in active_threads:
         console.print(f"Alert from camera {serial_number}: {payload_dict}")
+        console.print("[green]People detected on camera![/] Starting detection thread...")
 
-        if 'counts' in payload_dict and payload_dict['counts']['person'] > 0:
-            console.print("[green]People detected on camera![/] Starting detection thread...")
-
-            # Create a new thread and store it in the active_threads dictionary
-            message_thread = threading.Thread(target=process_message, args=(serial_number, payload_dict))
-            active_threads[serial_number] = message_thread
-            message_thread.start()
+        # Create a new thread and store it in the active_threads dictionary
+        message_thread = threading.Thread(target=process_message, args=(serial_number, payload_dict))
+        active_threads[serial_number] = message_thread
+        message_thread.start()
 
 
 if __name__ == "__main__":
     try:
-        client = mqtt.Client()
-        client.on_connect = on_connect
-        client.on_message = on_message
-        client.connect(config.MQTT_SERVER, config.MQTT_PORT, 60)
-        client.loop_forever()
+        ingest = mqtt_ingest.MQTTIngest(on_event=handle_event)
+        ingest.client.on_connect = on_connect
+
+        # Pick up cameras.json/ppe_zones.json edits without restarting (keeps model loaded and MQTT session)
+        ppe_config.add_listener(on_config_reload)
+        ppe_config.start_watcher()
+
+        asyncio.run(ingest.run(config.MQTT_SERVER, config.MQTT_PORT, 60))
 
     except Exception as ex:
         console.print("[red]MQTT failed to connect or receive msg from mqtt, due to: \n {0}[/]".format(ex))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import os
+
+import numpy as np
+from ultralytics import YOLO
+
+# Absolute path to detection directory
+current_directory = os.path.dirname(os.path.abspath(__file__))
+
+# YOLOv8 ML Model File
+MODEL_PATH = f"{current_directory}/ppe_dataset/weights/best.pt"
+
+# Minimum confidence threshold for detections
+CONFIDENCE = 0.5
+
+
+def load_model():
+    """
+    Load YOLOv8 PPE model
+    :return: YOLO model
+    """
+    return YOLO(MODEL_PATH)
+
+
+def extract_detections(result, policy):
+    """
+    Extract the bounding boxes, class names and probabilities relevant to a PPE zone from a YOLOv8 result
+    :param result: YOLOv8 result for a single image
+    :param policy: Compiled PPE zone policy
+    :return: Outputs ([x_center, y_center, width, height, class_name, prob] per box), detected class names
+    """
+    outputs = []
+    classes = []
+    for box in result.boxes:
+        # class id (box id), translated class name
+        class_id = box.cls[0].item()
+        class_name = result.names[class_id]
+
+        # Ignore 'Person Class' to clean up image, ignore PPE items we aren't enforcing in this zone (both no and
+        # normal versions of class)
+        ppe_comparison = class_name.replace('No', '').strip()
+        if class_name == 'Person' or ppe_comparison in policy.ignored:
+            continue
+
+        # class prob(box probability)
+        prob = round(box.conf[0].item(), 2)
+
+        # Centroid X,Y and width/height of bounding box normalized to image size
+        x1, y1, nw, nh = [
+            round(x) for x in box.xywh[0].tolist()
+        ]
+
+        outputs.append([
+            x1, y1, nw, nh, class_name, prob
+        ])
+
+        classes.append(class_name)
+
+    return outputs, classes
+
+
+def extract_person_boxes(result):
+    """
+    Extract 'Person' bounding boxes from a YOLOv8 result
+    :param result: YOLOv8 result for a single image
+    :return: Array of shape (N, 4) with x1, y1, x2, y2 per person
+    """
+    person_ids = [class_id for class_id, class_name in result.names.items() if class_name == 'Person']
+    class_ids = result.boxes.cls.cpu().numpy().astype(int)
+
+    return result.boxes.xyxy.cpu().numpy()[np.isin(class_ids, person_ids)]
+
+
+def detect_ppe_state(ppe_detected, policy):
+    """
+    Determine if all PPE is present in desired zone or not (adjust 'state' - Valid, Invalid, Unknown appropriately)
+    :param ppe_detected: PPE classes detected in image
+    :param policy: Compiled PPE zone policy to check
+    :return: Boolean representing if all PPE is present
+    """
+    # Enforced PPE items (precomputed when the zone was loaded)
+    ppe_to_check = policy.required
+
+    # Check if a PPE Violation is detected - No Class (Case 1):
+    no_class_present = any('No' in item for item in ppe_detected)
+    if no_class_present:
+        return False
+
+    # Check if all PPE is present (Case 2)
+    if len(ppe_detected) > 0:
+        all_ppe_present = all(item in ppe_to_check for item in ppe_detected)
+
+        # Determine if proper PPE worn (based on zone)
+        if all_ppe_present:
+            return True
+
+    # Unable to determine if all PPE detected (ex: not all objects could be reasonably detected, no objects present)
+    return None
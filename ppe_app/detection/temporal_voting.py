@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import threading
+import time
+from collections import Counter, deque
+from typing import NamedTuple
+
+# Sliding window size (n) and number of agreeing frames (k) required to emit a verdict
+WINDOW_SIZE = 5
+AGREEMENT = 3
+
+# Seconds after which a frame no longer counts towards a verdict
+WINDOW_MAX_AGE = 120
+
+# Seconds between frames while no verdict has been reached: short after an Unknown frame, longer after a Valid or
+# Invalid frame that still needs confirming
+UNCERTAIN_INTERVAL = 3
+CONFIRM_INTERVAL = 6
+
+# Seconds to wait after a verdict, doubled for every repeated identical verdict up to the max
+STABLE_INTERVAL = 20
+MAX_STABLE_INTERVAL = 160
+
+# Returned by verdict() when no state has reached k-of-n agreement
+PENDING = 'pending'
+
+
+class Observation(NamedTuple):
+    """
+    Detection result of a single frame
+    """
+    timestamp: float
+    state: object
+    histogram: Counter
+    confidences: Counter
+
+
+class CameraWindow:
+    """
+    Sliding window of recent detection results for a camera
+    """
+
+    def __init__(self, size=WINDOW_SIZE, agreement=AGREEMENT, max_age=WINDOW_MAX_AGE):
+        self.size = size
+        self.agreement = agreement
+        self.max_age = max_age
+        self.observations = deque(maxlen=size)
+        self.last_verdict = PENDING
+        self.repeats = 0
+
+    def add(self, state, outputs):
+        """
+        Add the result of a frame to the window
+        :param state: PPE state of the frame (True, False, None)
+        :param outputs: Detections of the frame ([x_center, y_center, width, height, class_name, prob] per box)
+        """
+        histogram = Counter(output[4] for output in outputs)
+
+        # Sum of box confidences per class in this frame
+        confidences = Counter()
+        for output in outputs:
+            confidences[output[4]] += output[5]
+
+        self.observations.append(Observation(time.monotonic(), state, histogram, confidences))
+
+    def recent(self):
+        """
+        Get observations that are not older than max_age
+        :return: List of observations
+        """
+        cutoff = time.monotonic() - self.max_age
+        return [observation for observation in self.observations if observation.timestamp >= cutoff]
+
+    def verdict(self):
+        """
+        Determine state agreed on by at least k of the last n frames (a violation wins over a valid state)
+        :return: True, False, None (Unknown) or PENDING
+        """
+        votes = Counter(observation.state for observation in self.recent())
+        for state in (False, True, None):
+            if votes[state] >= self.agreement:
+                return state
+        return PENDING
+
+    def summary(self):
+        """
+        Aggregate class histogram and mean confidence per class over the window (for display)
+        :return: Dictionary of class name to (count, mean confidence)
+        """
+        counts = Counter()
+        confidence_sums = Counter()
+        for observation in self.recent():
+            counts.update(observation.histogram)
+            confidence_sums.update(observation.confidences)
+
+        return {class_name: (count, round(confidence_sums[class_name] / count, 2))
+                for class_name, count in counts.items()}
+
+    def next_interval(self):
+        """
+        Seconds to wait before sampling the next frame while no verdict has been reached
+        :return: Seconds
+        """
+        if not self.observations or self.observations[-1].state is None:
+            return UNCERTAIN_INTERVAL
+        return CONFIRM_INTERVAL
+
+    def record_verdict(self, verdict):
+        """
+        Record emitted verdict and get the cool down before the camera is checked again. Repeated identical
+        verdicts back off exponentially (stable scene), a changed verdict resets to STABLE_INTERVAL. The window is
+        cleared, the next verdict needs k new agreeing frames
+        :param verdict: Emitted verdict (PENDING if no agreement was reached)
+        :return: Seconds
+        """
+        if verdict is PENDING:
+            return UNCERTAIN_INTERVAL
+
+        self.observations.clear()
+
+        if verdict == self.last_verdict:
+            self.repeats += 1
+        else:
+            self.last_verdict = verdict
+            self.repeats = 0
+
+        return min(STABLE_INTERVAL * 2 ** self.repeats, MAX_STABLE_INTERVAL)
+
+
+# Windows per camera serial
+_windows = {}
+_lock = threading.Lock()
+
+
+def get_window(serial_number):
+    """
+    Get (or create) sliding window for a camera
+    :param serial_number: MV Camera Serial
+    :return: CameraWindow
+    """
+    with _lock:
+        if serial_number not in _windows:
+            _windows[serial_number] = CameraWindow()
+        return _windows[serial_number]
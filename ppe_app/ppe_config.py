@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import json
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from rich.console import Console
+
+# Rich Console Instance
+console = Console()
+
+# Absolute path to ppe_app directory
+parent_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Directory with cameras.json and ppe_zones.json (defaults to ppe_app). Docker mounts a directory here rather than
+# single files, editors that save by replacing the file would otherwise leave the container with the old file
+CONFIG_DIRECTORY = os.getenv("PPE_CONFIG_DIR", parent_directory)
+
+CAMERAS_FILE = f'{CONFIG_DIRECTORY}/cameras.json'
+PPE_ZONES_FILE = f'{CONFIG_DIRECTORY}/ppe_zones.json'
+
+# Seconds between checks for modified JSON files
+RELOAD_INTERVAL = 5
+
+
+class ZonePolicy(NamedTuple):
+    """
+    Compiled PPE zone: raw ppe_items plus precomputed sets of enforced and ignored items
+    """
+    name: str
+    ppe_items: dict
+    required: frozenset
+    ignored: frozenset
+
+
+class Camera(NamedTuple):
+    """
+    Camera entry from cameras.json, resolved against its PPE zone policy (None if the zone is undefined)
+    """
+    serial: str
+    ppe_zone_name: str
+    camera_zone_id: str
+    camera_location: str
+    topic: str
+    policy: Optional[ZonePolicy]
+
+
+class ConfigIndex(NamedTuple):
+    """
+    Immutable snapshot of both JSON files, indexed for lookups by serial, zone name and MQTT topic
+    """
+    cameras: dict
+    zones: dict
+    topics: dict
+    mtimes: tuple
+
+
+# Current index (replaced as a whole on reload, never mutated in place) and change listeners
+_index = None
+_failed_mtimes = None
+_listeners = []
+_lock = threading.Lock()
+
+
+def camera_topic(serial, camera_zone_id):
+    """
+    Build MV Sense MQTT topic for a camera (zone '0' is the full frame)
+    :param serial: MV Camera Serial
+    :param camera_zone_id: Camera Zone ID ('' if not specified)
+    :return: MQTT topic string
+    """
+    return "/merakimv/" + serial + '/' + (camera_zone_id if camera_zone_id != '' else '0')
+
+
+def compile_zone(zone):
+    """
+    Compile a ppe_zones.json entry into a ZonePolicy
+    :param zone: Raw zone dictionary
+    :return: ZonePolicy
+    """
+    ppe_items = dict(zone['ppe_items'])
+    required = frozenset(item for item, enforced in ppe_items.items() if enforced == True)
+    ignored = frozenset(item for item, enforced in ppe_items.items() if enforced == False)
+
+    return ZonePolicy(zone['ppe_zone_name'], ppe_items, required, ignored)
+
+
+def build_index(cameras, ppe_zones, mtimes=()):
+    """
+    Build ConfigIndex from parsed cameras.json and ppe_zones.json contents
+    :param cameras: List of camera dictionaries
+    :param ppe_zones: List of zone dictionaries
+    :param mtimes: Modification times of the source files (used to detect changes)
+    :return: ConfigIndex
+    """
+    # Build ppe zones
+    zones = {}
+    for zone in ppe_zones:
+        policy = compile_zone(zone)
+        zones[policy.name] = policy
+
+    # Add Cameras, resolve zone policy and MQTT topic once here rather than per message
+    camera_index = {}
+    topics = {}
+    for camera in cameras:
+        serial = camera['serial']
+        camera_zone_id = str(camera.get('camera_zone_id', ''))
+        topic = camera_topic(serial, camera_zone_id)
+
+        camera_index[serial] = Camera(serial, camera['ppe_zone_name'], camera_zone_id,
+                                      camera.get('camera_location', ''), topic, zones.get(camera['ppe_zone_name']))
+        topics[topic] = serial
+
+    return ConfigIndex(camera_index, zones, topics, mtimes)
+
+
+def _file_mtimes():
+    """
+    Get modification times of cameras.json and ppe_zones.json
+    :return: Tuple of modification times
+    """
+    return os.stat(CAMERAS_FILE).st_mtime_ns, os.stat(PPE_ZONES_FILE).st_mtime_ns
+
+
+def load():
+    """
+    Read in JSON Data Files and build a new ConfigIndex (does not replace the current index)
+    :return: ConfigIndex
+    """
+    mtimes = _file_mtimes()
+    with open(CAMERAS_FILE, 'r') as cam_fp, open(PPE_ZONES_FILE, 'r') as zone_fp:
+        ppe_zones = json.load(zone_fp)
+        cameras = json.load(cam_fp)
+
+    return build_index(cameras, ppe_zones, mtimes)
+
+
+def current():
+    """
+    Get current ConfigIndex, loading it on first use. Callers should hold on to the returned index for the duration
+    of one unit of work so they see a consistent view across a reload
+    :return: ConfigIndex
+    """
+    if _index is None:
+        reload()
+    return _index
+
+
+def add_listener(callback):
+    """
+    Register callback executed after a successful reload (called with the reload lock held, must not reload)
+    :param callback: Function taking (old_index, new_index)
+    """
+    _listeners.append(callback)
+
+
+def reload(force=True):
+    """
+    Reload JSON Data Files and atomically swap in the new index. On a parsing error, the previous index is kept
+    :param force: Reload even if the files have not changed
+    :return: True if a new index was applied
+    """
+    global _index, _failed_mtimes
+
+    with _lock:
+        old_index = _index
+        try:
+            # Skip unchanged files, and files that already failed to parse (report each broken edit once)
+            if not force and old_index is not None and _file_mtimes() in (old_index.mtimes, _failed_mtimes):
+                return False
+            new_index = load()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if old_index is None:
+                raise
+            try:
+                _failed_mtimes = _file_mtimes()
+            except OSError:
+                _failed_mtimes = None
+            console.print(f"[red]Failed to reload camera/zone configuration, keeping previous: {str(e)}[/]")
+            return False
+
+        _index = new_index
+
+        if old_index is not None:
+            console.print(f"[green]Reloaded configuration:[/] {len(new_index.cameras)} camera(s), "
+                          f"{len(new_index.zones)} PPE zone(s)")
+
+        # Listeners run under the lock so concurrent reloads deliver (old, new) indexes in order
+        for callback in _listeners:
+            try:
+                callback(old_index, new_index)
+            except Exception as e:
+                console.print(f"[red]Configuration listener failed: {str(e)}[/]")
+
+    return True
+
+
+def watch_thread(interval):
+    """
+    Periodically check cameras.json and ppe_zones.json for changes and reload them - run in background thread
+    :param interval: Seconds between checks
+    """
+    while True:
+        time.sleep(interval)
+        reload(force=False)
+
+
+def start_watcher(interval=RELOAD_INTERVAL):
+    """
+    Spawn daemon thread watching the JSON Data Files for changes
+    :param interval: Seconds between checks
+    """
+    watcher = threading.Thread(target=watch_thread, args=(interval,))
+    watcher.daemon = True
+    watcher.start()
@@ -17,8 +17,8 @@ __copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
 __license__ = "Cisco Sample Code License, Version 1.1"
 
 import datetime
-import json
 import os
+import sys
 
 import cv2
 import meraki
@@ -27,9 +27,15 @@ from flask import Flask, render_template, request, Response, session, jsonify, s
 from rich.console import Console
 from dotenv import load_dotenv
 
+# Shared camera/PPE zone configuration (ppe_app/ppe_config.py), PPE model and annotation (ppe_app/detection)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'detection'))
+import ppe_config
+
 # Load Environment Variables
 load_dotenv()
 MERAKI_API_KEY = os.getenv("MERAKI_API_KEY")
+LIVE_OVERLAY = os.getenv("LIVE_OVERLAY", "false").lower() == "true"
 
 # Global variables
 app = Flask(__name__)
@@ -41,10 +47,6 @@ console = Console()
 # Meraki Dashboard Instance
 dashboard = meraki.DashboardAPI(MERAKI_API_KEY, suppress_logging=True)
 
-# Configure global dictionaries
-CAMERAS = {}
-ZONE_PPE = {}
-
 # Global PPE State
 current_state = None
 
@@ -55,18 +57,8 @@ parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Create Snapshots directory
 os.makedirs(f'{parent_directory}/snapshots', exist_ok=True)
 
-# Read in JSON Data Files, populate Global dictionaries
-with open(f'{parent_directory}/cameras.json', 'r') as cam_fp, open(f'{parent_directory}/ppe_zones.json', 'r') as zone_fp:
-    ppe_zones = json.load(zone_fp)
-    cameras = json.load(cam_fp)
-
-    # Build ppe zones
-    for zone in ppe_zones:
-        ZONE_PPE[zone['ppe_zone_name']] = zone['ppe_items']
-
-    # Add Cameras
-    for camera in cameras:
-        CAMERAS[camera['serial']] = camera['ppe_zone_name']
+# Read in JSON Data Files (fail fast on startup if they are missing or invalid)
+ppe_config.current()
 
 
 # Methods
@@ -143,7 +135,7 @@ def index():
 
     # Render page
     return render_template('index.html', hiddenLinks=False, timeAndLocation=getSystemTimeAndLocation(),
-                           errorcode=error_code, camera_list=CAMERAS, display_feed=False)
+                           errorcode=error_code, camera_list=ppe_config.current().cameras, display_feed=False)
 
 
 @app.route('/display', methods=["POST"])
@@ -158,13 +150,15 @@ def display():
     console.print(f"Display RTSP and PPE Detection Stream from camera serial: [blue]{serial_number}[/]")
 
     # Determine correct ppe for zone associated to camera
+    index = ppe_config.current()
     required_ppe = None
     ppe_zone_name = None
-    if serial_number in CAMERAS:
-        ppe_zone_name = CAMERAS[serial_number]
+    if serial_number in index.cameras:
+        camera = index.cameras[serial_number]
+        ppe_zone_name = camera.ppe_zone_name
 
-        if ppe_zone_name in ZONE_PPE:
-            required_ppe = ZONE_PPE[ppe_zone_name]
+        if camera.policy is not None:
+            required_ppe = camera.policy.ppe_items
 
     # Enable RTSP/Get RTSP stream
     response = dashboard.camera.updateDeviceCameraVideoSettings(serial_number, externalRtspEnabled=True)
@@ -172,12 +166,13 @@ def display():
     rtsp_url = response['rtspUrl']
     console.print(f"RTSP stream link obtained: [blue]{rtsp_url}[/]")
 
-    # Store stream in session object for requests to /video_feed
+    # Store stream (and camera for the live overlay) in session object for requests to /video_feed
     session['rtsp_url'] = rtsp_url
+    session['serial_number'] = serial_number
 
     # Render page
     return render_template('index.html', hiddenLinks=False, timeAndLocation=getSystemTimeAndLocation(),
-                           errorcode=error_code, camera_list=CAMERAS, ppe_zone_name=ppe_zone_name,
+                           errorcode=error_code, camera_list=index.cameras, ppe_zone_name=ppe_zone_name,
                            required_ppe=required_ppe, current_state=current_state,
                            display_feeds=True, serial_number=serial_number)
 
@@ -221,14 +216,25 @@ def retrieve_image(serialNumber):
 def video_feed():
     """
     Enable RTSP stream for local camera display on Webpage. Return frames yielded from method, display RTSP stream on
-    web poge
+    web poge (with live PPE detections drawn on it if LIVE_OVERLAY is enabled)
     """
     rtsp_url = session.get('rtsp_url')  # Retrieve the RTSP URL from the session
     if rtsp_url:
+        camera = ppe_config.current().cameras.get(session.get('serial_number'))
+        if LIVE_OVERLAY and camera is not None and camera.policy is not None:
+            # Imported here, the model dependencies are only needed with the overlay enabled
+            import live_overlay
+
+            return Response(live_overlay.stream_frames(camera.serial, rtsp_url, camera.policy),
+                            mimetype='multipart/x-mixed-replace; boundary=frame')
+
         return Response(generate_frames(rtsp_url), mimetype='multipart/x-mixed-replace; boundary=frame')
     else:
         return "No RTSP URL available"
 
 
 if __name__ == "__main__":
+    # Pick up cameras.json/ppe_zones.json edits without restarting
+    ppe_config.start_watcher()
+
     app.run(host='0.0.0.0', port=4000, debug=False)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+""" Copyright (c) 2023 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+__author__ = "Mark Orszycki <morszyck@cisco.com>, Trevor Maco <tmaco@cisco.com>"
+__copyright__ = "Copyright (c) 2023 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+import threading
+import time
+
+import cv2
+from rich.console import Console
+
+from annotation import Annotator
+from ppe_inference import CONFIDENCE, load_model, extract_detections
+
+# Rich Console Instance
+console = Console()
+
+# Minimum seconds between two inferences on a stream (inference runs on the newest frame, frames in between reuse
+# the latest detections)
+INFERENCE_INTERVAL = 0.5
+
+# Inference image size for live frames (smaller than the training size, keeps CPU-only hosts real time)
+INFERENCE_IMGSZ = 640
+
+# Seconds after which detections are too old to draw
+MAX_DETECTION_AGE = 2.0
+
+# Outgoing MJPEG frame width and quality (matches the dashboard display size)
+OUTPUT_WIDTH = 900
+OUTPUT_JPEG_QUALITY = 80
+
+# YOLOv8 ML Model (loaded on first use, shared by all streams)
+_model = None
+_model_lock = threading.Lock()
+
+# Running streams per (camera serial, RTSP URL), shared by all viewers of a camera
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def predict(frame):
+    """
+    Run YOLOv8 prediction on a live frame (serialized, model is shared across streams)
+    :param frame: Video frame
+    :return: YOLOv8 result
+    """
+    global _model
+
+    with _model_lock:
+        if _model is None:
+            console.print("Loading PPE model for live overlay...")
+            _model = load_model()
+        return _model.predict(frame, conf=CONFIDENCE, imgsz=INFERENCE_IMGSZ, verbose=False)[0]
+
+
+class LiveOverlayStream:
+    """
+    RTSP stream with PPE detections drawn on the frames. A reader thread keeps only the newest frame (the stream never
+    falls behind real time), an inference thread runs the model on the newest frame when it's free. One stream serves
+    all viewers of a camera, so the RTSP connection, inference budget and JPEG encoding are per camera, not per viewer
+    """
+
+    def __init__(self, rtsp_url, policy):
+        """
+        :param rtsp_url: RTSP URL for Camera
+        :param policy: Compiled PPE zone policy of the camera
+        """
+        self.rtsp_url = rtsp_url
+        self.policy = policy
+        self.annotator = Annotator(OUTPUT_WIDTH, OUTPUT_JPEG_QUALITY)
+        self.condition = threading.Condition()
+        self.running = True
+        self.viewers = 0
+
+        # Newest frame and latest detections
+        self.frame = None
+        self.frame_id = 0
+        self.outputs = []
+        self.detected_at = 0.0
+
+        # Newest encoded frame (encoded once, sent to every viewer)
+        self.encode_lock = threading.Lock()
+        self.encoded = None
+        self.encoded_id = 0
+
+    def start(self):
+        """
+        Start background reader and inference threads
+        """
+        threading.Thread(target=self.read_frames, daemon=True).start()
+        threading.Thread(target=self.run_inference, daemon=True).start()
+
+    def stop(self):
+        """
+        Stop background threads
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def read_frames(self):
+        """
+        Read frames as fast as the camera sends them, keep only the newest - run in background thread
+        """
+        cap = cv2.VideoCapture(self.rtsp_url)
+        try:
+            while self.running:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                with self.condition:
+                    self.frame = frame
+                    self.frame_id += 1
+                    self.condition.notify_all()
+        finally:
+            cap.release()
+            self.stop()
+
+    def run_inference(self):
+        """
+        Run the model on the newest frame at most every INFERENCE_INTERVAL seconds - run in background thread
+        """
+        last_id = 0
+        while self.running:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or self.frame_id != last_id)
+                if not self.running:
+                    break
+                frame, last_id = self.frame, self.frame_id
+
+            start = time.monotonic()
+            try:
+                outputs, _ = extract_detections(predict(frame), self.policy)
+            except Exception as e:
+                console.print(f"[red]Live overlay inference failed: {str(e)}[/]")
+                outputs = []
+
+            with self.condition:
+                self.outputs = outputs
+                self.detected_at = time.monotonic()
+
+            # Time budget: skip frames until the interval has passed
+            time.sleep(max(INFERENCE_INTERVAL - (time.monotonic() - start), 0))
+
+    def encode(self, frame_id, frame, outputs):
+        """
+        Draw detections on a frame and encode it, unless another viewer already encoded this (or a newer) frame
+        :return: JPEG bytes
+        """
+        with self.encode_lock:
+            if self.encoded_id < frame_id:
+                # Annotator draws on the resized frame, copy only if it would draw on the shared frame itself
+                if frame.shape[1] <= OUTPUT_WIDTH:
+                    frame = frame.copy()
+                self.encoded = self.annotator.encode(frame, outputs)
+                self.encoded_id = frame_id
+            return self.encoded
+
+    def frames(self):
+        """
+        Yield the newest frames with the latest (not stale) detections drawn on them, as MJPEG parts
+        :return: Individual video frames in bytes
+        """
+        last_id = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or self.frame_id != last_id)
+                if not self.running:
+                    break
+                frame, last_id = self.frame, self.frame_id
+                outputs = self.outputs if time.monotonic() - self.detected_at <= MAX_DETECTION_AGE else []
+
+            frame = self.encode(last_id, frame, outputs)
+
+            # Return frame in bytes to html, streamed to flask page
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+
+
+def stream_frames(serial_number, rtsp_url, policy):
+    """
+    Yield live overlay frames for a viewer, sharing one stream per camera and RTSP URL. The stream starts with its first
+    viewer and stops when the last one disconnects
+    :param serial_number: MV Camera Serial
+    :param rtsp_url: RTSP URL for Camera
+    :param policy: Compiled PPE zone policy of the camera
+    :return: Individual video frames in bytes
+    """
+    key = (serial_number, rtsp_url)
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is None or not stream.running:
+            stream = LiveOverlayStream(rtsp_url, policy)
+            _streams[key] = stream
+            stream.start()
+
+        # Pick up PPE zone changes (config hot reload)
+        stream.policy = policy
+        stream.viewers += 1
+
+    try:
+        yield from stream.frames()
+    finally:
+        # Client disconnected or stream ended, stop background threads once nobody is watching
+        with _streams_lock:
+            stream.viewers -= 1
+            if stream.viewers == 0:
+                stream.stop()
+                if _streams.get(key) is stream:
+                    del _streams[key]
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(root, 'ppe_app'))
+sys.path.append(os.path.join(root, 'ppe_app', 'detection'))
+
+import mqtt_ingest
+from mqtt_ingest import MQTTIngest, TopicSubscriptions
+from ppe_config import build_index
+
+ZONES = [{'ppe_zone_name': 'Site', 'ppe_items': {'Helmet': True}}]
+
+
+class StubClient:
+    """
+    Records (un)subscribe calls
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, topics):
+        self.calls.append(('subscribe', topics))
+
+    def unsubscribe(self, topics):
+        self.calls.append(('unsubscribe', topics))
+
+
+def index_for(*serials):
+    return build_index([{'serial': serial, 'ppe_zone_name': 'Site'} for serial in serials], ZONES)
+
+
+def test_only_changed_topics_are_subscribed():
+    client = StubClient()
+    subscriptions = TopicSubscriptions()
+
+    subscriptions.sync(client, index_for('Q2AA', 'Q2BB'))
+    assert client.calls == [('subscribe', [('/merakimv/Q2AA/0', 0), ('/merakimv/Q2BB/0', 0)])]
+
+    client.calls.clear()
+    added, removed = subscriptions.sync(client, index_for('Q2BB', 'Q2CC'))
+    assert (added, removed) == ({'/merakimv/Q2CC/0'}, {'/merakimv/Q2AA/0'})
+    assert client.calls == [('unsubscribe', ['/merakimv/Q2AA/0']), ('subscribe', [('/merakimv/Q2CC/0', 0)])]
+
+
+def test_unchanged_index_sends_nothing():
+    client = StubClient()
+    subscriptions = TopicSubscriptions()
+    subscriptions.sync(client, index_for('Q2AA'))
+
+    client.calls.clear()
+    assert subscriptions.sync(client, index_for('Q2AA')) == (set(), set())
+    assert client.calls == []
+
+
+def test_reset_subscribes_everything_again():
+    client = StubClient()
+    subscriptions = TopicSubscriptions()
+    subscriptions.sync(client, index_for('Q2AA'))
+
+    client.calls.clear()
+    subscriptions.reset()
+    subscriptions.sync(client, index_for('Q2AA'))
+    assert client.calls == [('subscribe', [('/merakimv/Q2AA/0', 0)])]
+
+
+def test_malformed_payloads_do_not_stop_consumer():
+    events = []
+    ingest = MQTTIngest(on_event=lambda serial_number, payload_dict: events.append(serial_number))
+
+    async def consume(payloads):
+        ingest.queue = asyncio.Queue()
+        for serial_number, payload in payloads:
+            ingest.queue.put_nowait((serial_number, payload, time.monotonic()))
+
+        task = asyncio.create_task(ingest.consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(consume([('Q2AA', b'{"counts": {"person": null}}'), ('Q2BB', b'{"counts": []}'),
+                         ('Q2CC', b'not json'), ('Q2DD', b'{"counts": {"person": 0}}'),
+                         ('Q2EE', b'{"counts": {"person": 2}}')]))
+
+    assert events == ['Q2EE']
+    assert ingest.telemetry.parse_errors == 3
+
+
+def test_failed_task_is_restarted(monkeypatch):
+    monkeypatch.setattr(mqtt_ingest, 'TASK_RESTART_DELAY', 0)
+    ingest = MQTTIngest(on_event=None)
+    runs = []
+
+    async def flaky():
+        runs.append(len(runs))
+        if len(runs) == 1:
+            raise TypeError('boom')
+        await asyncio.sleep(1)
+
+    async def supervise():
+        task = asyncio.create_task(ingest.supervise(flaky))
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(supervise())
+    assert runs == [0, 1]
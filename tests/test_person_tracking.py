@@ -0,0 +1,106 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ppe_app', 'detection'))
+
+import person_tracking
+from person_tracking import ALERT_MEMORY, PersonTracker, associate_ppe, outputs_to_xyxy, unalerted_violations
+from temporal_voting import MAX_STABLE_INTERVAL, STABLE_INTERVAL
+
+PERSON_BOXES = np.array([[0, 0, 100, 300], [200, 0, 300, 300]], dtype=float)
+OUTPUTS = [[50, 20, 40, 40, 'Helmet', 0.9], [250, 20, 40, 40, 'NoHelmet', 0.8]]
+
+
+def evaluate(classes):
+    return False if any('No' in item for item in classes) else (True if classes else None)
+
+
+def test_ppe_attached_to_containing_person():
+    assignment = associate_ppe(PERSON_BOXES, outputs_to_xyxy(OUTPUTS + [[500, 500, 10, 10, 'Vest', 0.5]]))
+
+    assert assignment.tolist() == [0, 1, -1]
+
+
+
+def test_ppe_outside_persons_is_returned_unassigned():
+    stray = [500, 500, 40, 40, 'NoVest', 0.7]
+    frame_tracks, _, unassigned = PersonTracker().update(PERSON_BOXES, OUTPUTS + [stray], evaluate)
+
+    assert [track.state for track in frame_tracks] == [True, False]
+    assert unassigned == [stray]
+
+def test_tracked_person_only_alerts_once():
+    tracker = PersonTracker()
+    frame_tracks, evaluated, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert [track.state for track in frame_tracks] == [True, False]
+    assert len(evaluated) == 2
+    assert [track.track_id for track in unalerted_violations(frame_tracks[1:])] == [2]
+
+    # Same persons, same PPE: no re-evaluation, no new alert
+    frame_tracks, evaluated, _ = tracker.update(PERSON_BOXES + 5, OUTPUTS, evaluate)
+    assert [track.track_id for track in frame_tracks] == [1, 2]
+    assert evaluated == []
+    assert unalerted_violations(frame_tracks[1:]) == []
+
+
+class Clock:
+    """
+    Monotonic clock advanced by the test
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_same_person_after_cool_down_is_not_alerted_again(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(person_tracking, 'time', clock)
+    tracker = PersonTracker()
+
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert [track.track_id for track in unalerted_violations(frame_tracks[1:])] == [2]
+
+    # Cool down after the verdict (longest backoff), the tracks expire but the alert is remembered
+    clock.now += MAX_STABLE_INTERVAL + 1
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert [track.track_id for track in frame_tracks] == [3, 4]
+    assert unalerted_violations(frame_tracks[1:]) == []
+
+    # Another cool down, still the same person
+    clock.now += STABLE_INTERVAL + 1
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert unalerted_violations(frame_tracks[1:]) == []
+
+
+def test_alert_memory_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(person_tracking, 'time', clock)
+    tracker = PersonTracker()
+
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    unalerted_violations(frame_tracks)
+
+    clock.now += ALERT_MEMORY + 1
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert [track.track_id for track in unalerted_violations(frame_tracks[1:])] == [4]
+
+
+def test_compliant_person_is_alerted_on_next_violation(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(person_tracking, 'time', clock)
+    tracker = PersonTracker()
+
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    unalerted_violations(frame_tracks)
+
+    # Remembered person is back with a helmet, then takes it off again
+    clock.now += STABLE_INTERVAL + 1
+    compliant = [OUTPUTS[0], [250, 20, 40, 40, 'Helmet', 0.8]]
+    tracker.update(PERSON_BOXES, compliant, evaluate)
+    frame_tracks, _, _ = tracker.update(PERSON_BOXES, OUTPUTS, evaluate)
+    assert [track.track_id for track in unalerted_violations(frame_tracks[1:])] == [4]
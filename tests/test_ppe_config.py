@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ppe_app'))
+
+from ppe_config import build_index
+
+ZONES = [{'ppe_zone_name': 'Site', 'ppe_items': {'Helmet': True, 'Vest': True, 'Mask': False, 'Gloves': None}}]
+
+
+def test_zone_policy_is_compiled():
+    policy = build_index([], ZONES).zones['Site']
+
+    assert policy.required == {'Helmet', 'Vest'}
+    assert policy.ignored == {'Mask'}
+
+
+def test_topics_route_to_camera_serials():
+    cameras = [{'serial': 'Q2AA', 'ppe_zone_name': 'Site', 'camera_zone_id': '58'},
+               {'serial': 'Q2BB', 'ppe_zone_name': 'Site', 'camera_zone_id': ''},
+               {'serial': 'Q2CC', 'ppe_zone_name': 'Site'},
+               {'serial': 'Q2DD', 'ppe_zone_name': 'Site', 'camera_zone_id': 0}]
+    index = build_index(cameras, ZONES)
+
+    assert index.topics == {'/merakimv/Q2AA/58': 'Q2AA', '/merakimv/Q2BB/0': 'Q2BB', '/merakimv/Q2CC/0': 'Q2CC',
+                            '/merakimv/Q2DD/0': 'Q2DD'}
+    assert index.cameras['Q2DD'].camera_zone_id == '0'
+
+
+def test_camera_with_undefined_zone_has_no_policy():
+    index = build_index([{'serial': 'Q2AA', 'ppe_zone_name': 'Missing'}], ZONES)
+
+    assert index.cameras['Q2AA'].policy is None
+    assert index.cameras['Q2AA'].camera_location == ''
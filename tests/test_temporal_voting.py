@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ppe_app', 'detection'))
+
+from temporal_voting import CameraWindow, PENDING, STABLE_INTERVAL
+
+
+def test_verdict_requires_k_of_n_agreement():
+    window = CameraWindow(size=5, agreement=3)
+
+    window.add(False, [])
+    window.add(True, [])
+    window.add(False, [])
+    assert window.verdict() is PENDING
+
+    window.add(False, [])
+    assert window.verdict() is False
+
+
+def test_unknown_frames_can_agree():
+    window = CameraWindow(size=5, agreement=3)
+    for _ in range(3):
+        window.add(None, [])
+
+    assert window.verdict() is None
+
+
+def test_emitted_verdict_clears_window():
+    window = CameraWindow(size=5, agreement=3)
+    for _ in range(3):
+        window.add(False, [])
+    assert window.verdict() is False
+
+    assert window.record_verdict(False) == STABLE_INTERVAL
+
+    # Frames of the previous run don't count towards the next verdict
+    window.add(True, [])
+    assert window.verdict() is PENDING
+
+
+def test_pending_verdict_keeps_window():
+    window = CameraWindow(size=5, agreement=3)
+    window.add(False, [])
+    window.add(False, [])
+
+    window.record_verdict(PENDING)
+    window.add(False, [])
+    assert window.verdict() is False
+
+
+def test_summary_aggregates_classes():
+    window = CameraWindow()
+    window.add(False, [[0, 0, 1, 1, 'NoHelmet', 0.8], [0, 0, 1, 1, 'Vest', 0.6]])
+    window.add(False, [[0, 0, 1, 1, 'NoHelmet', 0.6]])
+
+    assert window.summary() == {'NoHelmet': (2, 0.7), 'Vest': (1, 0.6)}
+
+
+def test_summary_averages_every_box():
+    window = CameraWindow()
+    window.add(False, [[0, 0, 1, 1, 'NoHelmet', 0.9], [0, 0, 1, 1, 'NoHelmet', 0.5]])
+    window.add(False, [[0, 0, 1, 1, 'NoHelmet', 0.7]])
+
+    assert window.summary() == {'NoHelmet': (3, 0.7)}